@@ -1,35 +1,75 @@
 import zoom_meeting_sdk as zoom
-from datetime import datetime
+import time
+import logging
 import numpy as np
-import cv2
 from .video_input_manager import VideoInputManager
+from .participant_cache import ParticipantCache
 
 import gi
 gi.require_version('GLib', '2.0')
 from gi.repository import GLib
 
+logger = logging.getLogger(__name__)
+
+# SDK constants used in per-event / per-frame callbacks, bound once so they aren't looked up on the extension module every call
+_SHARING_OTHER_SHARE_BEGIN = zoom.Sharing_Other_Share_Begin
+_SHARING_VIEW_OTHER_SHARING = zoom.Sharing_View_Other_Sharing
+_FRAME_DATA_FORMAT_I420_FULL = zoom.FrameDataFormat_I420_FULL
+_AUDIO_CHANNEL_MONO = zoom.ZoomSDKAudioChannel_Mono
+
+# The black frame for a given size never changes, so compute it once and reuse it
+_BLACK_YUV420_FRAME_CACHE = {}
 
 def create_black_yuv420_frame(width=640, height=360):
-    # Create BGR frame (red is [0,0,0] in BGR)
-    bgr_frame = np.zeros((height, width, 3), dtype=np.uint8)
-    bgr_frame[:, :] = [0, 0, 0]  # Pure black in BGR
-    
-    # Convert BGR to YUV420 (I420)
-    yuv_frame = cv2.cvtColor(bgr_frame, cv2.COLOR_BGR2YUV_I420)
-    
-    # Return as bytes
-    return yuv_frame.tobytes()
+    key = (width, height)
+    cached_frame = _BLACK_YUV420_FRAME_CACHE.get(key)
+    if cached_frame is not None:
+        return cached_frame
+
+    # Build the I420 planes directly. Black is Y=0 with U=V=128, which is what
+    # converting a zeroed BGR frame with COLOR_BGR2YUV_I420 produces.
+    y_plane_size = width * height
+    uv_plane_size = (width // 2) * (height // 2)
+    _BLACK_YUV420_FRAME_CACHE[key] = bytes(y_plane_size) + b"\x80" * (2 * uv_plane_size)
+    return _BLACK_YUV420_FRAME_CACHE[key]
+
+
+# Messages sent to the bot controller through send_message_callback
+MSG_LEAVE_MEETING_WAITING_FOR_HOST = "Leave meeting because received waiting for host status"
+MSG_ZOOM_AUTHORIZATION_FAILED = "Zoom authorization failed"
+MSG_BOT_PUT_IN_WAITING_ROOM = "Bot put in waiting room"
+MSG_BOT_JOINED_MEETING = "Bot joined meeting"
+MSG_BOT_RECORDING_PERMISSION_GRANTED = "Bot recording permission granted"
+MSG_MEETING_ENDED = "Meeting ended"
+MSG_NEW_UTTERANCE = "New utterance"
 
 
 class ZoomBotAdapter:
+    # Kept so that code outside the adapter can keep referring to ZoomBotAdapter.Messages.*
     class Messages:
-        LEAVE_MEETING_WAITING_FOR_HOST = "Leave meeting because received waiting for host status"
-        ZOOM_AUTHORIZATION_FAILED = "Zoom authorization failed"
-        BOT_PUT_IN_WAITING_ROOM = "Bot put in waiting room"
-        BOT_JOINED_MEETING = "Bot joined meeting"
-        BOT_RECORDING_PERMISSION_GRANTED = "Bot recording permission granted"
-        MEETING_ENDED = "Meeting ended"
-        NEW_UTTERANCE = "New utterance"
+        LEAVE_MEETING_WAITING_FOR_HOST = MSG_LEAVE_MEETING_WAITING_FOR_HOST
+        ZOOM_AUTHORIZATION_FAILED = MSG_ZOOM_AUTHORIZATION_FAILED
+        BOT_PUT_IN_WAITING_ROOM = MSG_BOT_PUT_IN_WAITING_ROOM
+        BOT_JOINED_MEETING = MSG_BOT_JOINED_MEETING
+        BOT_RECORDING_PERMISSION_GRANTED = MSG_BOT_RECORDING_PERMISSION_GRANTED
+        MEETING_ENDED = MSG_MEETING_ENDED
+        NEW_UTTERANCE = MSG_NEW_UTTERANCE
+
+    # Every attribute the adapter sets. Using slots keeps instances small and makes attribute access in the SDK callbacks cheaper.
+    __slots__ = (
+        'display_name', 'send_message_callback', 'add_audio_chunk_callback', 'add_mixed_audio_chunk_callback',
+        'add_video_frame_callback', 'wants_any_video_frames_callback', '_jwt_token', 'meeting_id', 'meeting_password',
+        'meeting_service', 'setting_service', 'auth_service', 'auth_event', 'recording_event', 'meeting_service_event',
+        'audio_source', 'audio_helper', 'audio_settings', 'use_raw_recording', 'recording_permission_granted',
+        'reminder_controller', 'recording_ctrl', 'audio_raw_data_sender', 'virtual_audio_mic_event_passthrough',
+        'my_participant_id', 'participants_ctrl', 'participants_ctrl_event', 'meeting_reminder_event',
+        'on_mic_start_send_callback_called', 'on_virtual_camera_start_send_callback_called',
+        'meeting_video_controller', 'video_sender', 'virtual_camera_video_source', 'video_source_helper',
+        'video_frame_size', 'video_input_manager',
+        'meeting_sharing_controller', 'meeting_share_ctrl_event', 'audio_ctrl', 'audio_ctrl_event',
+        'active_speaker_id', 'active_sharer_id', '_last_video_input_state', '_participant_cache',
+        '_other_participant_ids'
+    )
 
     def __init__(self, *, display_name, send_message_callback, add_audio_chunk_callback, meeting_password, token, meeting_id, add_video_frame_callback, wants_any_video_frames_callback, add_mixed_audio_chunk_callback):
         self.display_name = display_name
@@ -85,25 +125,42 @@ class ZoomBotAdapter:
 
         self.active_speaker_id = None
         self.active_sharer_id = None
+        # (active_sharer_id, active_speaker_id) that the video input manager was last configured for
+        self._last_video_input_state = None
 
-        self._participant_cache = {}
+        self._participant_cache = ParticipantCache()
+        # Ids of everyone in the meeting except the bot, kept up to date from the join / leave callbacks
+        # so we don't have to fetch the participant list from the SDK. A dict is used as an insertion-ordered set.
+        self._other_participant_ids = {}
 
     def on_user_join_callback(self, joined_user_ids, _):
         print("on_user_join_callback called. joined_user_ids =", joined_user_ids)
+        get_participant = self.get_participant
         for joined_user_id in joined_user_ids:
-            self.get_participant(joined_user_id)
+            get_participant(joined_user_id)
+            if joined_user_id != self.my_participant_id:
+                self._other_participant_ids[joined_user_id] = None
 
-    def on_user_active_audio_change_callback(self, user_ids):
-        if len(user_ids) == 0:
-            return
+        # The default participant we fall back to can change when someone joins
+        self._last_video_input_state = None
+
+    def on_user_left_callback(self, left_user_ids, _):
+        print("on_user_left_callback called. left_user_ids =", left_user_ids)
+        for left_user_id in left_user_ids:
+            self._other_participant_ids.pop(left_user_id, None)
 
-        if user_ids[0] == self.my_participant_id:
+        # The default participant we fall back to can change when someone leaves
+        self._last_video_input_state = None
+
+    def on_user_active_audio_change_callback(self, user_ids):
+        if not user_ids:
             return
 
-        if self.active_speaker_id == user_ids[0]:
+        new_active_speaker_id = user_ids[0]
+        if new_active_speaker_id == self.my_participant_id or new_active_speaker_id == self.active_speaker_id:
             return
 
-        self.active_speaker_id = user_ids[0]
+        self.active_speaker_id = new_active_speaker_id
         self.set_video_input_manager_based_on_state()
 
     def set_video_input_manager_based_on_state(self):
@@ -112,7 +169,13 @@ class ZoomBotAdapter:
         
         if not self.recording_permission_granted:
             return
-        
+
+        # Nothing to do if the video input manager is already set up for this sharer / speaker
+        video_input_state = (self.active_sharer_id, self.active_speaker_id)
+        if video_input_state == self._last_video_input_state:
+            return
+        self._last_video_input_state = video_input_state
+
         print("set_video_input_manager_based_on_state self.active_sharer_id =", self.active_sharer_id, "self.active_speaker_id =", self.active_speaker_id)
         if self.active_sharer_id:
             self.video_input_manager.set_mode(mode=VideoInputManager.Mode.ACTIVE_SHARER, active_sharer_id=self.active_sharer_id, active_speaker_id=self.active_speaker_id)
@@ -121,13 +184,7 @@ class ZoomBotAdapter:
         else:
             # If there is no active sharer or speaker, we'll just use the video of the first participant that is not the bot
             # or if there are no participants, we'll use the bot
-            default_participant_id = self.my_participant_id
-
-            participant_list = self.participants_ctrl.GetParticipantsList()
-            for participant_id in participant_list:
-                if participant_id != self.my_participant_id:
-                    default_participant_id = participant_id
-                    break
+            default_participant_id = next(iter(self._other_participant_ids), self.my_participant_id)
 
             print("set_video_input_manager_based_on_state hit default case. default_participant_id =", default_participant_id)
             self.video_input_manager.set_mode(mode=VideoInputManager.Mode.ACTIVE_SPEAKER, active_speaker_id=default_participant_id, active_sharer_id=None)
@@ -149,13 +206,12 @@ class ZoomBotAdapter:
             print("meanProcessingTimeMicroseconds =", float(performance_data.totalProcessingTimeMicroseconds) / performance_data.numCalls)
 
             # Print processing time distribution
-            bin_size = (performance_data.processingTimeBinMax - performance_data.processingTimeBinMin) / len(performance_data.processingTimeBinCounts)
+            bin_counts = np.asarray(performance_data.processingTimeBinCounts)
+            bin_size = (performance_data.processingTimeBinMax - performance_data.processingTimeBinMin) / len(bin_counts)
+            bin_edges = np.arange(len(bin_counts) + 1) * bin_size
             print("\nProcessing time distribution (microseconds):")
-            for bin_idx, count in enumerate(performance_data.processingTimeBinCounts):
-                if count > 0:
-                    bin_start = bin_idx * bin_size
-                    bin_end = (bin_idx + 1) * bin_size
-                    print(f"{bin_start:6.0f} - {bin_end:6.0f} us: {count:5d} calls")
+            for bin_idx in np.flatnonzero(bin_counts):
+                print(f"{bin_edges[bin_idx]:6.0f} - {bin_edges[bin_idx + 1]:6.0f} us: {bin_counts[bin_idx]:5d} calls")
 
         if self.meeting_service:
             zoom.DestroyMeetingService(self.meeting_service)
@@ -196,13 +252,9 @@ class ZoomBotAdapter:
     def get_participant(self, participant_id):
         try:
             speaker_object = self.participants_ctrl.GetUserByUserID(participant_id)
-            participant_info = {
-                'participant_uuid': participant_id,
-                'participant_user_uuid': speaker_object.GetPersistentId(),
-                'participant_full_name': speaker_object.GetUserName()
-            }
-            self._participant_cache[participant_id] = participant_info
-            return participant_info
+            participant_cache = self._participant_cache
+            participant_cache.set(participant_id, speaker_object.GetPersistentId(), speaker_object.GetUserName())
+            return participant_cache.get(participant_id)
         except:
             print(f"Error getting participant {participant_id}, falling back to cache")
             return self._participant_cache.get(participant_id)
@@ -210,7 +262,7 @@ class ZoomBotAdapter:
     def on_sharing_status_callback(self, sharing_status, user_id):
         print("on_sharing_status_callback called. sharing_status =", sharing_status, "user_id =", user_id)
 
-        if sharing_status == zoom.Sharing_Other_Share_Begin or sharing_status == zoom.Sharing_View_Other_Sharing:
+        if sharing_status == _SHARING_OTHER_SHARE_BEGIN or sharing_status == _SHARING_VIEW_OTHER_SHARING:
             new_active_sharer_id = user_id
         else:
             new_active_sharer_id = None
@@ -227,12 +279,16 @@ class ZoomBotAdapter:
 
         # Participants controller
         self.participants_ctrl = self.meeting_service.GetMeetingParticipantsController()
-        self.participants_ctrl_event = zoom.MeetingParticipantsCtrlEventCallbacks(onUserJoinCallback=self.on_user_join_callback)
+        self.participants_ctrl_event = zoom.MeetingParticipantsCtrlEventCallbacks(onUserJoinCallback=self.on_user_join_callback, onUserLeftCallback=self.on_user_left_callback)
         self.participants_ctrl.SetEvent(self.participants_ctrl_event)
         self.my_participant_id = self.participants_ctrl.GetMySelfUser().GetUserID()
-        participant_ids_list = self.participants_ctrl.GetParticipantsList()
-        for participant_id in participant_ids_list:
-            self.get_participant(participant_id)
+        self._other_participant_ids.pop(self.my_participant_id, None)
+        # There is no batch user lookup in the SDK, so bind the lookup once instead of resolving it per participant
+        get_participant = self.get_participant
+        for participant_id in self.participants_ctrl.GetParticipantsList():
+            get_participant(participant_id)
+            if participant_id != self.my_participant_id:
+                self._other_participant_ids[participant_id] = None
 
         # Meeting sharing controller
         self.meeting_sharing_controller = self.meeting_service.GetMeetingShareController()
@@ -259,9 +315,14 @@ class ZoomBotAdapter:
 
             self.start_raw_recording()
 
-        # Set up media streams
-        GLib.timeout_add_seconds(1, self.set_up_bot_audio_input)
-        GLib.timeout_add_seconds(1, self.set_up_bot_video_input)
+        # Set up media streams. The SDK doesn't tell us when the virtual mic / camera can be attached after joining,
+        # so give it a second to settle first.
+        GLib.timeout_add_seconds(1, self.set_up_bot_media_inputs)
+
+    def set_up_bot_media_inputs(self):
+        self.set_up_bot_audio_input()
+        self.set_up_bot_video_input()
+        return False  # Only run once
 
     def set_up_bot_video_input(self):
         self.virtual_camera_video_source = zoom.ZoomSDKVideoSourceCallbacks(onInitializeCallback=self.on_virtual_camera_initialize_callback, onStartSendCallback=self.on_virtual_camera_start_send_callback)
@@ -283,7 +344,7 @@ class ZoomBotAdapter:
         # Not sure why this happens.
         if self.video_sender and not self.on_virtual_camera_start_send_callback_called:
             blank = create_black_yuv420_frame(640, 360)
-            initial_send_video_frame_response = self.video_sender.sendVideoFrame(blank, 640, 360, 0, zoom.FrameDataFormat_I420_FULL)
+            initial_send_video_frame_response = self.video_sender.sendVideoFrame(blank, 640, 360, 0, _FRAME_DATA_FORMAT_I420_FULL)
             print("initial_send_video_frame_response =", initial_send_video_frame_response)
         self.on_virtual_camera_start_send_callback_called = True
 
@@ -293,8 +354,8 @@ class ZoomBotAdapter:
     def send_raw_image(self, yuv420_image_bytes):
         if not self.on_virtual_camera_start_send_callback_called:
             raise Exception("on_virtual_camera_start_send_callback_called not called so cannot send raw image")
-        send_video_frame_response = self.video_sender.sendVideoFrame(yuv420_image_bytes, 640, 360, 0, zoom.FrameDataFormat_I420_FULL)
-        print("send_raw_image send_video_frame_response =", send_video_frame_response)
+        send_video_frame_response = self.video_sender.sendVideoFrame(yuv420_image_bytes, 640, 360, 0, _FRAME_DATA_FORMAT_I420_FULL)
+        logger.debug("send_raw_image send_video_frame_response = %s", send_video_frame_response)
 
     def set_up_bot_audio_input(self):
         if self.audio_helper is None:
@@ -321,7 +382,7 @@ class ZoomBotAdapter:
     def send_raw_audio(self, bytes):
         if not self.on_mic_start_send_callback_called:
             raise Exception("on_mic_start_send_callback_called not called so cannot send raw audio")
-        self.audio_raw_data_sender.send(bytes, 8000, zoom.ZoomSDKAudioChannel_Mono)
+        self.audio_raw_data_sender.send(bytes, 8000, _AUDIO_CHANNEL_MONO)
 
     def on_mic_start_send_callback(self):
         self.on_mic_start_send_callback_called = True
@@ -330,10 +391,9 @@ class ZoomBotAdapter:
     def on_one_way_audio_raw_data_received_callback(self, data, node_id):
         if node_id == self.my_participant_id:
             return
-        
-        current_time = datetime.utcnow()
 
-        self.add_audio_chunk_callback(node_id, current_time, data.GetBuffer())
+        # Wall clock time in nanoseconds. This is a plain int, so it's much cheaper to produce per chunk than a datetime.
+        self.add_audio_chunk_callback(node_id, time.time_ns(), data.GetBuffer())
 
     def start_raw_recording(self):
         self.recording_ctrl = self.meeting_service.GetMeetingRecordingController()
@@ -365,10 +425,11 @@ class ZoomBotAdapter:
         audio_helper_subscribe_result = self.audio_helper.subscribe(self.audio_source, False)
         print("audio_helper_subscribe_result =",audio_helper_subscribe_result)
 
-        self.send_message_callback({'message': self.Messages.BOT_RECORDING_PERMISSION_GRANTED})
+        self.send_message_callback({'message': MSG_BOT_RECORDING_PERMISSION_GRANTED})
         self.recording_permission_granted = True
 
-        GLib.timeout_add(100, self.set_up_video_input_manager)
+        # Set up the video input manager as soon as the main loop has finished dispatching the current event
+        GLib.idle_add(self.set_up_video_input_manager)
 
     def stop_raw_recording(self):
         rec_ctrl = self.meeting_service.StopRawRecording()
@@ -420,22 +481,22 @@ class ZoomBotAdapter:
             print("Auth completed successfully.")
             return self.join_meeting()
 
-        self.send_message_callback({'message': self.Messages.ZOOM_AUTHORIZATION_FAILED, 'zoom_result_code': result})
+        self.send_message_callback({'message': MSG_ZOOM_AUTHORIZATION_FAILED, 'zoom_result_code': result})
     
     def meeting_status_changed(self, status, iResult):
         print("meeting_status_changed called. status =",status,"iResult=",iResult)
 
         if status == zoom.MEETING_STATUS_WAITINGFORHOST:
-            self.send_message_callback({'message': self.Messages.LEAVE_MEETING_WAITING_FOR_HOST})
+            self.send_message_callback({'message': MSG_LEAVE_MEETING_WAITING_FOR_HOST})
 
         if status == zoom.MEETING_STATUS_IN_WAITING_ROOM:
-            self.send_message_callback({'message': self.Messages.BOT_PUT_IN_WAITING_ROOM})
+            self.send_message_callback({'message': MSG_BOT_PUT_IN_WAITING_ROOM})
 
         if status == zoom.MEETING_STATUS_INMEETING:
-            self.send_message_callback({'message': self.Messages.BOT_JOINED_MEETING})
+            self.send_message_callback({'message': MSG_BOT_JOINED_MEETING})
 
         if status == zoom.MEETING_STATUS_ENDED:
-            self.send_message_callback({'message': self.Messages.MEETING_ENDED})
+            self.send_message_callback({'message': MSG_MEETING_ENDED})
 
 
         if status == zoom.MEETING_STATUS_INMEETING:
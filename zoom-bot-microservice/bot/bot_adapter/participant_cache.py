@@ -0,0 +1,34 @@
+class ParticipantCache:
+    """
+    Caches participant info for the lifetime of a meeting.
+
+    Stored as parallel lists (one entry per participant) plus an id -> index map rather than one
+    dict per participant, which keeps the per-participant overhead small in large meetings.
+    """
+
+    def __init__(self):
+        self._index_by_participant_id = {}
+        self._participant_ids = []
+        self._user_uuids = []
+        self._full_names = []
+
+    def set(self, participant_id, user_uuid, full_name):
+        index = self._index_by_participant_id.get(participant_id)
+        if index is None:
+            self._index_by_participant_id[participant_id] = len(self._participant_ids)
+            self._participant_ids.append(participant_id)
+            self._user_uuids.append(user_uuid)
+            self._full_names.append(full_name)
+        else:
+            self._user_uuids[index] = user_uuid
+            self._full_names[index] = full_name
+
+    def get(self, participant_id):
+        index = self._index_by_participant_id.get(participant_id)
+        if index is None:
+            return None
+        return {
+            'participant_uuid': self._participant_ids[index],
+            'participant_user_uuid': self._user_uuids[index],
+            'participant_full_name': self._full_names[index]
+        }
@@ -4,125 +4,164 @@ import cv2
 from gi.repository import GLib
 import time
 import logging
+import functools
+import queue
+import threading
 
 logger = logging.getLogger(__name__)
 
+# The frame is identical for a given size, so build it once and share the immutable bytes.
+@functools.lru_cache(maxsize=8)
 def create_black_i420_frame(video_frame_size):
     width, height = video_frame_size
     # Ensure dimensions are even for proper chroma subsampling
     if width % 2 != 0 or height % 2 != 0:
         raise ValueError("Width and height must be even numbers for I420 format")
     
-    # Y plane (black = 0 in Y plane)
-    y_plane = np.zeros((height, width), dtype=np.uint8)
-    
-    # U and V planes (black = 128 in UV planes)
-    # Both are quarter size of original due to 4:2:0 subsampling
-    u_plane = np.full((height // 2, width // 2), 128, dtype=np.uint8)
-    v_plane = np.full((height // 2, width // 2), 128, dtype=np.uint8)
-    
-    # Concatenate all planes
-    yuv_frame = np.concatenate([
-        y_plane.flatten(),
-        u_plane.flatten(),
-        v_plane.flatten()
-    ])
-    
-    return yuv_frame.astype(np.uint8).tobytes()
+    # Y plane is black = 0, which the zero-initialised buffer already provides.
+    # U and V planes (black = 128) are each quarter size due to 4:2:0 subsampling.
+    y_size = width * height
+    uv_size = (width // 2) * (height // 2)
+    yuv_frame = bytearray(y_size + 2 * uv_size)
+    yuv_frame[y_size:] = b'\x80' * (2 * uv_size)
 
-def scale_i420(frame, new_size):
-    new_width, new_height = new_size
+    return bytes(yuv_frame)
+
+def create_i420_output_buffer(video_frame_size):
     """
-    Scales the given frame in I420 format to new_width x new_height while
-    preserving aspect ratio. If the aspect ratios do not match, letterboxes/pillarboxes
-    the scaled image on a black background.
-    
-    :param frame: Frame object with methods:
-        - GetStreamWidth()
-        - GetStreamHeight()
-        - GetYBuffer()
-        - GetUBuffer()
-        - GetVBuffer()
-    :param new_width: Desired width.
-    :param new_height: Desired height.
-    :return: Scaled (and possibly letter/pillarboxed) I420 frame bytes.
+    Allocates a reusable I420 buffer of the given size.
+
+    :return: (buffer, (y_plane, u_plane, v_plane)) where the planes are writable
+        NumPy views into the bytearray.
+    """
+    width, height = video_frame_size
+    y_size = width * height
+    uv_size = (width // 2) * (height // 2)
+    buffer = bytearray(y_size + 2 * uv_size)
+
+    y_plane = np.frombuffer(buffer, dtype=np.uint8, count=y_size).reshape(height, width)
+    u_plane = np.frombuffer(buffer, dtype=np.uint8, count=uv_size, offset=y_size).reshape(height // 2, width // 2)
+    v_plane = np.frombuffer(buffer, dtype=np.uint8, count=uv_size, offset=y_size + uv_size).reshape(height // 2, width // 2)
+
+    return buffer, (y_plane, u_plane, v_plane)
+
+class I420Scaler:
+    """
+    Scales frames in I420 format to a fixed output size while preserving aspect ratio.
+    If the aspect ratios do not match, letterboxes/pillarboxes the scaled image on a
+    black background.
+
+    The output buffer and the placement of the scaled image inside it are cached for the
+    current source resolution, so in the steady state each frame only resizes into the
+    active region; the black bars are written once per geometry change.
     """
-    orig_width = frame.GetStreamWidth()
-    orig_height = frame.GetStreamHeight()
-
-    # 1) Convert buffers to NumPy arrays without extra copies if possible.
-    y = np.frombuffer(frame.GetYBuffer(), dtype=np.uint8, count=orig_width*orig_height)
-    u = np.frombuffer(frame.GetUBuffer(), dtype=np.uint8, count=(orig_width//2)*(orig_height//2))
-    v = np.frombuffer(frame.GetVBuffer(), dtype=np.uint8, count=(orig_width//2)*(orig_height//2))
-
-    # Reshape planes
-    y = y.reshape(orig_height, orig_width)
-    u = u.reshape(orig_height//2, orig_width//2)
-    v = v.reshape(orig_height//2, orig_width//2)
-
-    # 2) Determine scale preserving aspect ratio
-    input_aspect = orig_width / orig_height
-    output_aspect = new_width / new_height
-
-    if abs(input_aspect - output_aspect) < 1e-6:
-        # Aspect ratios match (or extremely close). Just do a simple stretch to (new_width, new_height).
-        scaled_y = cv2.resize(y, (new_width, new_height), interpolation=cv2.INTER_LINEAR)
-        scaled_u = cv2.resize(u, (new_width//2, new_height//2), interpolation=cv2.INTER_LINEAR)
-        scaled_v = cv2.resize(v, (new_width//2, new_height//2), interpolation=cv2.INTER_LINEAR)
-
-        # Flatten and return
-        return np.concatenate([
-            scaled_y.flatten(),
-            scaled_u.flatten(),
-            scaled_v.flatten()
-        ]).astype(np.uint8).tobytes()
-
-    # Otherwise, the aspect ratios differ => letterbox or pillarbox
-    # 3) Compute scaled dimensions that fit entirely within (new_width, new_height)
-    if input_aspect > output_aspect:
-        # The image is relatively wider => match width, shrink height
-        scaled_width = new_width
-        scaled_height = int(round(new_width / input_aspect))
-    else:
-        # The image is relatively taller => match height, shrink width
-        scaled_height = new_height
-        scaled_width = int(round(new_height * input_aspect))
-
-    # 4) Resize Y, U, and V to the scaled dimensions
-    scaled_y = cv2.resize(y, (scaled_width, scaled_height), interpolation=cv2.INTER_LINEAR)
-    scaled_u = cv2.resize(u, (scaled_width//2, scaled_height//2), interpolation=cv2.INTER_LINEAR)
-    scaled_v = cv2.resize(v, (scaled_width//2, scaled_height//2), interpolation=cv2.INTER_LINEAR)
-
-    # 5) Create the black background only if needed
-    # For I420, black is typically (Y=0, U=128, V=128) or (Y=16, U=128, V=128).
-    # We'll use Y=0, U=128, V=128 for "dark" black.
-    final_y = np.zeros((new_height, new_width), dtype=np.uint8)
-    final_u = np.full((new_height//2, new_width//2), 128, dtype=np.uint8)
-    final_v = np.full((new_height//2, new_width//2), 128, dtype=np.uint8)
-
-    # 6) Compute centering offsets for each plane
-    # For Y-plane
-    offset_y = (new_height - scaled_height) // 2
-    offset_x = (new_width - scaled_width) // 2
-
-    # Insert Y
-    final_y[offset_y:offset_y+scaled_height, offset_x:offset_x+scaled_width] = scaled_y
-
-    # For U, V planes (subsampled by 2 in each dimension)
-    offset_y_uv = offset_y // 2
-    offset_x_uv = offset_x // 2
-
-    final_u[offset_y_uv:offset_y_uv+(scaled_height//2),
-            offset_x_uv:offset_x_uv+(scaled_width//2)] = scaled_u
-    final_v[offset_y_uv:offset_y_uv+(scaled_height//2),
-            offset_x_uv:offset_x_uv+(scaled_width//2)] = scaled_v
-
-    # 7) Flatten back to I420 layout and return bytes
-    return np.concatenate([
-        final_y.flatten(),
-        final_u.flatten(),
-        final_v.flatten()
-    ]).astype(np.uint8).tobytes()
+
+    def __init__(self, video_frame_size):
+        self.output_buffer, self.output_planes = create_i420_output_buffer(video_frame_size)
+        self.source_size = None
+        # (y_count, uv_count, y_shape, uv_shape) for the current source resolution
+        self.source_dims = None
+        # (y, u, v) views into output_planes that the scaled image is written to
+        self.target_planes = None
+        self.is_identity = False
+        self.interpolation = cv2.INTER_LINEAR
+
+    def update_geometry(self, orig_width, orig_height):
+        final_y, final_u, final_v = self.output_planes
+        new_height, new_width = final_y.shape
+
+        self.source_dims = (
+            orig_width * orig_height,
+            (orig_width // 2) * (orig_height // 2),
+            (orig_height, orig_width),
+            (orig_height // 2, orig_width // 2),
+        )
+
+        # 1) Determine scale preserving aspect ratio
+        input_aspect = orig_width / orig_height
+        output_aspect = new_width / new_height
+
+        if abs(input_aspect - output_aspect) < 1e-6:
+            # Aspect ratios match (or extremely close). Just do a simple stretch to (new_width, new_height).
+            self.target_planes = self.output_planes
+            # Same size needs no resize at all, only a copy into the output layout
+            self.is_identity = orig_width == new_width and orig_height == new_height
+            # INTER_AREA gives better quality and a faster path when shrinking
+            self.interpolation = cv2.INTER_AREA if new_width < orig_width else cv2.INTER_LINEAR
+            self.source_size = (orig_width, orig_height)
+            return
+
+        # Otherwise, the aspect ratios differ => letterbox or pillarbox
+        # 2) Compute scaled dimensions that fit entirely within (new_width, new_height)
+        if input_aspect > output_aspect:
+            # The image is relatively wider => match width, shrink height
+            scaled_width = new_width
+            scaled_height = int(round(new_width / input_aspect))
+        else:
+            # The image is relatively taller => match height, shrink width
+            scaled_height = new_height
+            scaled_width = int(round(new_height * input_aspect))
+
+        self.is_identity = False
+        self.interpolation = cv2.INTER_AREA if scaled_width < orig_width else cv2.INTER_LINEAR
+
+        # 3) Fill the black background
+        # For I420, black is typically (Y=0, U=128, V=128) or (Y=16, U=128, V=128).
+        # We'll use Y=0, U=128, V=128 for "dark" black.
+        final_y.fill(0)
+        final_u.fill(128)
+        final_v.fill(128)
+
+        # 4) Compute centering offsets for each plane
+        # For Y-plane
+        offset_y = (new_height - scaled_height) // 2
+        offset_x = (new_width - scaled_width) // 2
+
+        # For U, V planes (subsampled by 2 in each dimension)
+        offset_y_uv = offset_y // 2
+        offset_x_uv = offset_x // 2
+
+        self.target_planes = (
+            final_y[offset_y:offset_y+scaled_height, offset_x:offset_x+scaled_width],
+            final_u[offset_y_uv:offset_y_uv+(scaled_height//2), offset_x_uv:offset_x_uv+(scaled_width//2)],
+            final_v[offset_y_uv:offset_y_uv+(scaled_height//2), offset_x_uv:offset_x_uv+(scaled_width//2)],
+        )
+        self.source_size = (orig_width, orig_height)
+
+    def scale(self, orig_width, orig_height, i420_buffer):
+        """
+        :param orig_width: Width of the source frame.
+        :param orig_height: Height of the source frame.
+        :param i420_buffer: Packed source I420 frame bytes (Y plane, then U, then V).
+        :return: Scaled (and possibly letter/pillarboxed) I420 frame bytes.
+        """
+        if self.source_size != (orig_width, orig_height):
+            self.update_geometry(orig_width, orig_height)
+
+        y_count, uv_count, y_shape, uv_shape = self.source_dims
+
+        # One view over the packed frame, sliced into planes without copying
+        source = np.frombuffer(i420_buffer, dtype=np.uint8, count=y_count + 2 * uv_count)
+        y = source[:y_count].reshape(y_shape)
+        u = source[y_count:y_count + uv_count].reshape(uv_shape)
+        v = source[y_count + uv_count:].reshape(uv_shape)
+
+        target_y, target_u, target_v = self.target_planes
+
+        if self.is_identity:
+            np.copyto(target_y, y)
+            np.copyto(target_u, u)
+            np.copyto(target_v, v)
+            return bytes(self.output_buffer)
+
+        # Resize Y, U, and V straight into their place in the output planes
+        interpolation = self.interpolation
+        cv2.resize(y, (target_y.shape[1], target_y.shape[0]), dst=target_y, interpolation=interpolation)
+        cv2.resize(u, (target_u.shape[1], target_u.shape[0]), dst=target_u, interpolation=interpolation)
+        cv2.resize(v, (target_v.shape[1], target_v.shape[0]), dst=target_v, interpolation=interpolation)
+
+        # The output buffer already holds the I420 layout; copy it out once
+        return bytes(self.output_buffer)
 
 class VideoInputStream:
     def __init__(self, video_input_manager, user_id, stream_type):
@@ -130,6 +169,7 @@ class VideoInputStream:
         self.user_id = user_id
         self.stream_type = stream_type
         self.renderer_destroyed = False
+        self.black_frame_timer_id = None
         self.renderer_delegate = zoom.ZoomSDKRendererDelegateCallbacks(
             onRawDataFrameReceivedCallback=self.on_raw_video_frame_received_callback,
             onRendererBeDestroyedCallback=self.on_renderer_destroyed_callback,
@@ -146,32 +186,93 @@ class VideoInputStream:
         subscribe_result = self.renderer.subscribe(self.user_id, raw_data_type)
         self.raw_data_status = zoom.RawData_Off
 
-        self.last_frame_time = time.time()
+        self.last_frame_time_ns = time.monotonic_ns()
+        # Raw data starts off, so send black frames until on_raw_data_status_changed_callback says otherwise
         self.black_frame_timer_id = GLib.timeout_add(250, self.send_black_frame)
 
         logger.info(f"In VideoInputStream.init self.renderer = {self.renderer}")
         logger.info(f"In VideoInputStream.init set_resolution_result for user {self.user_id} is {set_resolution_result}")
         logger.info(f"In VideoInputStream.init subscribe_result for user {self.user_id} is {subscribe_result}")
         self.last_debug_frame_time = None
+        self.scaler = I420Scaler(self.video_input_manager.video_frame_size)
+
+        # Each stream has its own queue and worker, so a busy stream can't push another stream's frames out
+        self.frame_queue = queue.Queue(maxsize=VideoInputManager.MAX_QUEUED_FRAMES)
+        self.cleaned_up = False
+        self.scale_worker_thread = threading.Thread(target=self.run_scale_worker, daemon=True)
+        self.scale_worker_thread.start()
 
     def on_raw_data_status_changed_callback(self, status):
         self.raw_data_status = status
         logger.info(f"In VideoInputStream.on_raw_data_status_changed_callback raw_data_status for user {self.user_id} is {self.raw_data_status}")
 
+        # Black frames are only needed while raw data is off, so only keep the timer running then
+        if status == zoom.RawData_Off:
+            if self.black_frame_timer_id is None and not self.renderer_destroyed:
+                self.black_frame_timer_id = GLib.timeout_add(250, self.send_black_frame)
+        elif self.black_frame_timer_id is not None:
+            GLib.source_remove(self.black_frame_timer_id)
+            self.black_frame_timer_id = None
+
     def send_black_frame(self):
-        if self.renderer_destroyed:
+        if self.renderer_destroyed or self.raw_data_status != zoom.RawData_Off:
+            self.black_frame_timer_id = None
             return False
-            
-        current_time = time.time()
-        if current_time - self.last_frame_time >= 0.25 and self.raw_data_status == zoom.RawData_Off:
+
+        if time.monotonic_ns() - self.last_frame_time_ns >= 250_000_000:
             # Create a black frame of the same dimensions
             black_frame = create_black_i420_frame(self.video_input_manager.video_frame_size)
             self.video_input_manager.new_frame_callback(black_frame, time.time_ns())
             logger.info(f"In VideoInputStream.send_black_frame for user {self.user_id} sent black frame")
             
-        return not self.renderer_destroyed  # Continue timer if not cleaned up
+        return True  # Continue timer while raw data stays off
+
+    def enqueue_frame(self, item):
+        while True:
+            try:
+                self.frame_queue.put_nowait(item)
+                return
+            except queue.Full:
+                pass
+
+            # Drop the oldest queued frame so the newest one always gets through
+            try:
+                self.frame_queue.get_nowait()
+            except queue.Empty:
+                continue
+            self.video_input_manager.dropped_frame_count += 1
+            if self.video_input_manager.dropped_frame_count % 100 == 1:
+                logger.warning(f"In VideoInputStream.enqueue_frame scale worker is behind, dropped {self.video_input_manager.dropped_frame_count} frames so far")
+
+    def run_scale_worker(self):
+        while True:
+            item = self.frame_queue.get()
+            if item is None or self.cleaned_up:
+                return
+
+            width, height, i420_buffer, current_time_ns = item
+            try:
+                scaled_i420_frame = self.scaler.scale(width, height, i420_buffer)
+            except Exception as e:
+                logger.error(f"In VideoInputStream.run_scale_worker error scaling frame for user {self.user_id}: {e}")
+                continue
+
+            # Only the scaling happens on this thread. The frame is pushed from the GLib main loop, like every
+            # other buffer that goes into the pipeline.
+            GLib.idle_add(self.push_scaled_frame, scaled_i420_frame, current_time_ns)
+
+    def push_scaled_frame(self, scaled_i420_frame, current_time_ns):
+        # The stream may have been removed while this frame was being scaled
+        if not self.cleaned_up and not self.video_input_manager.cleaned_up:
+            self.video_input_manager.new_frame_callback(scaled_i420_frame, current_time_ns)
+        return False
 
     def cleanup(self):
+        if not self.cleaned_up:
+            # Stop the scale worker. Frames it still hands back are dropped by push_scaled_frame.
+            self.cleaned_up = True
+            self.enqueue_frame(None)
+
         if self.renderer_destroyed:
             return
         
@@ -190,13 +291,13 @@ class VideoInputStream:
     def on_raw_video_frame_received_callback(self, data):
         current_time_ns = time.time_ns()
 
-        if self.renderer_destroyed:
+        if self.renderer_destroyed or self.cleaned_up:
             return
         
         if not self.video_input_manager.wants_frames_for_user(self.user_id):
             return
         
-        self.last_frame_time = time.time()
+        self.last_frame_time_ns = time.monotonic_ns()
 
         i420_frame = data.GetBuffer()
 
@@ -208,8 +309,14 @@ class VideoInputStream:
             logger.info(f"In VideoInputStream.on_raw_video_frame_received_callback for user {self.user_id} received frame")
             self.last_debug_frame_time = time.time()
 
-        scaled_i420_frame = scale_i420(data, self.video_input_manager.video_frame_size)
-        self.video_input_manager.new_frame_callback(scaled_i420_frame, current_time_ns)
+        # The frame object is only valid during this callback, so grab the buffer now and
+        # let the scale worker do the resize off the renderer thread
+        self.enqueue_frame((
+            data.GetStreamWidth(),
+            data.GetStreamHeight(),
+            bytes(i420_frame),
+            current_time_ns
+        ))
 
 class VideoInputManager:
     class StreamType:
@@ -220,6 +327,10 @@ class VideoInputManager:
         ACTIVE_SPEAKER = 1
         ACTIVE_SHARER = 2
 
+    # Frames waiting to be scaled. Kept small so that under back-pressure stale frames are
+    # dropped instead of building up latency.
+    MAX_QUEUED_FRAMES = 2
+
     def __init__(self, *, new_frame_callback, wants_any_frames_callback, video_frame_size):
         self.new_frame_callback = new_frame_callback
         self.wants_any_frames_callback = wants_any_frames_callback
@@ -227,33 +338,39 @@ class VideoInputManager:
         self.mode = None
         self.input_streams = []
 
+        # Frames dropped across all streams because their scale worker fell behind
+        self.dropped_frame_count = 0
+        self.cleaned_up = False
+
     def has_any_video_input_streams(self):
         return len(self.input_streams) > 0
 
     def add_input_streams_if_needed(self, streams_info):
-        streams_to_remove = [
-            input_stream for input_stream in self.input_streams 
-            if not any(
-                stream_info['user_id'] == input_stream.user_id and 
-                stream_info['stream_type'] == input_stream.stream_type 
-                for stream_info in streams_info
-            )
-        ]
-
-        for stream in streams_to_remove:
-            stream.cleanup()
-            self.input_streams.remove(stream)
+        desired_stream_keys = {(stream_info['user_id'], stream_info['stream_type']) for stream_info in streams_info}
+        existing_streams = {(input_stream.user_id, input_stream.stream_type): input_stream for input_stream in self.input_streams}
+
+        for stream_key in existing_streams.keys() - desired_stream_keys:
+            existing_streams.pop(stream_key).cleanup()
 
         for stream_info in streams_info:
-            if any(input_stream.user_id == stream_info['user_id'] and input_stream.stream_type == stream_info['stream_type'] for input_stream in self.input_streams):
+            stream_key = (stream_info['user_id'], stream_info['stream_type'])
+            if stream_key in existing_streams:
                 continue
 
-            self.input_streams.append(VideoInputStream(self, stream_info['user_id'], stream_info['stream_type']))
+            existing_streams[stream_key] = VideoInputStream(self, stream_info['user_id'], stream_info['stream_type'])
+
+        self.input_streams = list(existing_streams.values())
 
     def cleanup(self):
+        # Frames the scale workers still hand back are dropped by push_scaled_frame, so nothing reaches the
+        # pipeline after this returns
+        self.cleaned_up = True
         for input_stream in self.input_streams:
             input_stream.cleanup()
 
+        for input_stream in self.input_streams:
+            input_stream.scale_worker_thread.join()
+
     def set_mode(self, *, mode, active_speaker_id, active_sharer_id):
         if mode != VideoInputManager.Mode.ACTIVE_SPEAKER and mode != VideoInputManager.Mode.ACTIVE_SHARER:
             raise Exception("Unsupported mode " + str(mode))
@@ -4,9 +4,145 @@ from .audio_output_manager import AudioOutputManager
 from .streaming_uploader import StreamingUploader
 import os
 import signal
+import threading
 import redis
+import orjson
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+# One Redis client and pubsub connection shared by every BotController in the process. The pubsub
+# socket is watched by the GLib main loop, and each controller subscribes its own channel with a
+# handler that the pubsub dispatches to. If the connection drops, the pubsub is re-created and every
+# channel in _redis_channel_handlers is subscribed again.
+_redis_client = None
+_redis_pubsub = None
+_redis_watch_id = None
+_redis_reconnect_timer_id = None
+_redis_channel_handlers = {}
+
+def _get_redis_pubsub():
+    global _redis_client, _redis_pubsub
+    if _redis_pubsub is None:
+        redis_url = os.getenv('REDIS_URL') + ("?ssl_cert_reqs=none" if os.getenv('DISABLE_REDIS_SSL') else "")
+        # Keepalive lets an idle watched socket notice a dead connection without polling
+        _redis_client = redis.from_url(redis_url, socket_keepalive=True, max_connections=32)
+        _redis_pubsub = _redis_client.pubsub(ignore_subscribe_messages=True)
+    return _redis_pubsub
+
+def _watch_redis_pubsub():
+    import gi
+    gi.require_version('GLib', '2.0')
+    from gi.repository import GLib
+
+    global _redis_watch_id
+    connection = _redis_pubsub.connection
+    # redis-py has no public accessor for the socket, and it's only set while connected
+    if connection._sock is None:
+        connection.connect()
+    _redis_watch_id = GLib.io_add_watch(
+        connection._sock.fileno(),
+        GLib.PRIORITY_DEFAULT,
+        GLib.IO_IN | GLib.IO_HUP | GLib.IO_ERR,
+        _on_redis_readable
+    )
+
+def _reconnect_redis_pubsub():
+    global _redis_pubsub, _redis_watch_id, _redis_reconnect_timer_id
+    import gi
+    gi.require_version('GLib', '2.0')
+    from gi.repository import GLib
+
+    if _redis_watch_id is not None:
+        GLib.source_remove(_redis_watch_id)
+        _redis_watch_id = None
+    if _redis_pubsub is not None:
+        try:
+            _redis_pubsub.close()
+        except Exception:
+            pass
+        _redis_pubsub = None
+
+    try:
+        if _redis_channel_handlers:
+            _get_redis_pubsub().subscribe(**_redis_channel_handlers)
+            _watch_redis_pubsub()
+            print(f"Reconnected to Redis and resubscribed to {list(_redis_channel_handlers.keys())}")
+    except Exception as e:
+        print(f"ERROR: Failed to reconnect to Redis, bot commands are not being received. Retrying in 1 second: {e}")
+        if _redis_reconnect_timer_id is None:
+            _redis_reconnect_timer_id = GLib.timeout_add_seconds(1, _retry_reconnect_redis_pubsub)
+        return
+
+    if _redis_reconnect_timer_id is not None:
+        GLib.source_remove(_redis_reconnect_timer_id)
+        _redis_reconnect_timer_id = None
+
+def _retry_reconnect_redis_pubsub():
+    global _redis_reconnect_timer_id
+    _redis_reconnect_timer_id = None
+    _reconnect_redis_pubsub()
+    return False
+
+def _on_redis_readable(fd, condition):
+    import gi
+    gi.require_version('GLib', '2.0')
+    from gi.repository import GLib
+
+    global _redis_watch_id
+    try:
+        if condition & (GLib.IO_HUP | GLib.IO_ERR):
+            raise redis.exceptions.ConnectionError(f"Redis pubsub socket reported condition {condition}")
+
+        # Drain everything already received; handlers run from inside get_message()
+        while _redis_pubsub.connection.can_read(timeout=0):
+            try:
+                _redis_pubsub.get_message(timeout=0)
+            except redis.exceptions.ConnectionError:
+                raise
+            except Exception as e:
+                # A failing handler shouldn't stop the bot from receiving later commands
+                print(f"Error handling Redis message: {e}")
+    except Exception as e:
+        print(f"ERROR: Lost the Redis pubsub connection, reconnecting: {e}")
+        # Returning False removes this watch; the reconnect adds one for the new socket
+        _redis_watch_id = None
+        _reconnect_redis_pubsub()
+        return False
+    return True
+
+def subscribe_to_redis_channel(channel, handler):
+    _redis_channel_handlers[channel] = handler
+    # A pending reconnect subscribes every registered channel once it succeeds
+    if _redis_reconnect_timer_id is not None:
+        return
+
+    pubsub = _get_redis_pubsub()
+    pubsub.subscribe(**{channel: handler})
+    if _redis_watch_id is None:
+        _watch_redis_pubsub()
+
+def unsubscribe_from_redis_channel(channel):
+    _redis_channel_handlers.pop(channel, None)
+    if _redis_pubsub is not None and _redis_reconnect_timer_id is None:
+        try:
+            _redis_pubsub.unsubscribe(channel)
+        except redis.exceptions.ConnectionError as e:
+            # The channel is already gone from _redis_channel_handlers, so a reconnect won't resubscribe it
+            print(f"Error unsubscribing from Redis channel {channel}: {e}")
+
+# Media blobs are immutable, so decoded audio can be reused across plays of the same blob
+@functools.lru_cache(maxsize=64)
+def _get_pcm_for_media_blob(media_blob_id):
+    from bots.utils import mp3_to_pcm
+    return mp3_to_pcm(MediaBlob.objects.only('blob').get(id=media_blob_id).blob, sample_rate=8000)
+
+# PNG decode + colorspace conversion runs here so it never blocks the GLib main loop. Only the pure decode runs
+# on this thread; the blob is read from the database on the main loop, so the worker never opens a DB connection.
+_image_decode_executor = ThreadPoolExecutor(max_workers=1)
 
 class BotController:
+    # How many decoded image frames each bot keeps for repeated image media requests
+    MAX_DECODED_IMAGE_FRAMES = 16
 
     def get_zoom_bot_adapter(self):
         from bot.bot_adapter import ZoomBotAdapter
@@ -37,14 +173,12 @@ class BotController:
         return int(self.gstreamer_pipeline.start_time_ns / 1_000_000)
 
     def recording_file_saved(self, s3_storage_key):
-        recording = Recording.objects.get(bot=self.bot_in_db, is_default_recording=True)
-        recording.file = s3_storage_key
-        recording.first_buffer_timestamp_ms = self.get_first_buffer_timestamp_ms()
-        recording.save()
+        self.default_recording.file = s3_storage_key
+        self.default_recording.first_buffer_timestamp_ms = self.get_first_buffer_timestamp_ms()
+        self.default_recording.save(update_fields=['file', 'first_buffer_timestamp_ms'])
 
     def get_recording_filename(self):
-        recording = Recording.objects.get(bot=self.bot_in_db, is_default_recording=True)
-        return f"{hashlib.md5(recording.object_id.encode()).hexdigest()}.mp4"
+        return self.recording_filename
     
     def on_new_sample_from_gstreamer_pipeline(self, data):
         self.streaming_uploader.upload_part(data)
@@ -55,55 +189,79 @@ class BotController:
             return
         self.cleanup_called = True
 
-        normal_quitting_process_worked = False
-        import threading
-        def terminate_worker():
-            import time
-            time.sleep(20)
-            if normal_quitting_process_worked:
-                print("Normal quitting process worked, not force terminating worker")
-                return
-            print("Terminating worker with hard timeout...")
-            os.kill(os.getpid(), signal.SIGKILL)  # Force terminate the worker process
-        
-        termination_thread = threading.Thread(target=terminate_worker, daemon=True)
-        termination_thread.start()
-
-        if self.gstreamer_pipeline:
-            print("Telling gstreamer pipeline to cleanup...")
-            self.gstreamer_pipeline.cleanup()
+        # Hard timeout: if the normal quitting process hasn't finished in 20 seconds, the worker process is
+        # terminated. On the main thread this is done with SIGALRM, with the default action forced for the
+        # duration of cleanup since the host process may have its own handler. It's carried out by the kernel,
+        # so it works even if the main thread is stuck in native code. Signal handlers can only be installed
+        # from the main thread, so elsewhere a watchdog thread does the same with SIGKILL.
+        normal_quitting_process_worked = threading.Event()
+        on_main_thread = threading.current_thread() is threading.main_thread()
+        if on_main_thread:
+            previous_sigalrm_handler = signal.signal(signal.SIGALRM, signal.SIG_DFL)
+            signal.alarm(20)
+        else:
+            def terminate_worker():
+                if normal_quitting_process_worked.wait(20):
+                    return
+                print("Terminating worker with hard timeout...")
+                os.kill(os.getpid(), signal.SIGKILL)  # Force terminate the worker process
+
+            threading.Thread(target=terminate_worker, daemon=True).start()
 
-        if self.streaming_uploader:
-            print("Telling streaming uploader to cleanup...")
-            self.streaming_uploader.complete_upload()
-            self.recording_file_saved(self.streaming_uploader.key)
-
-        if self.adapter:
-            print("Telling adapter to leave meeting...")
-            self.adapter.leave()
-            print("Telling adapter to cleanup...")
-            self.adapter.cleanup()
-
-        if self.main_loop and self.main_loop.is_running():
-            self.main_loop.quit()
-
-        normal_quitting_process_worked = True
+        try:
+            print("Saving pending utterances...")
+            try:
+                self.flush_pending_utterances()
+            except Exception as e:
+                print(f"Error saving utterances: {e}")
+
+            if self.gstreamer_pipeline:
+                print("Telling gstreamer pipeline to cleanup...")
+                self.gstreamer_pipeline.cleanup()
+
+            if self.streaming_uploader:
+                print("Telling streaming uploader to cleanup...")
+                self.streaming_uploader.complete_upload()
+                self.recording_file_saved(self.streaming_uploader.key)
+
+            if self.adapter:
+                print("Telling adapter to leave meeting...")
+                self.adapter.leave()
+                print("Telling adapter to cleanup...")
+                self.adapter.cleanup()
+
+            if self.main_loop and self.main_loop.is_running():
+                self.main_loop.quit()
+
+            print("Normal quitting process worked, cancelling hard timeout")
+        finally:
+            normal_quitting_process_worked.set()
+            if on_main_thread:
+                signal.alarm(0)
+                signal.signal(signal.SIGALRM, previous_sigalrm_handler)
 
     def __init__(self, bot_id):
         self.bot_in_db = Bot.objects.get(id=bot_id)
+        # Fetched once; only the fields read or written here are loaded
+        self.default_recording = Recording.objects.only('id', 'object_id', 'file', 'first_buffer_timestamp_ms').get(bot=self.bot_in_db, is_default_recording=True)
+        self.recording_filename = f"{hashlib.md5(self.default_recording.object_id.encode()).hexdigest()}.mp4"
         self.cleanup_called = False
         self.run_called = False
+        # Looked up on the first utterance; cleared whenever bot/recording state may have changed
+        self.recording_in_progress = None
+        # Utterances are written to the database in batches; participant ids are cached by uuid
+        self.pending_utterance_messages = []
+        self.participant_ids_by_uuid = {}
+        # Decoded frames for images this bot has shown, keyed by media blob id. Bounded, oldest evicted first.
+        self.decoded_image_frames_by_media_blob_id = {}
 
     def run(self):
         if self.run_called:
             raise Exception("Run already called, exiting")
         self.run_called = True
 
-        redis_url = os.getenv('REDIS_URL') + ("?ssl_cert_reqs=none" if os.getenv('DISABLE_REDIS_SSL') else "")
-        redis_client = redis.from_url(redis_url)
-        pubsub = redis_client.pubsub()
         channel = f"bot_{self.bot_in_db.id}"
-        pubsub.subscribe(channel)
+        subscribe_to_redis_channel(channel, self.handle_redis_message)
         import gi
         gi.require_version('GLib', '2.0')
         from gi.repository import GLib
@@ -126,25 +284,12 @@ class BotController:
         # Create GLib main loop
         self.main_loop = GLib.MainLoop()
         
-        # Set up Redis listener in a separate thread
-        import threading
-        def redis_listener():
-            while True:
-                try:
-                    message = pubsub.get_message(timeout=1.0)
-                    if message:
-                        # Schedule Redis message handling in the main GLib loop
-                        GLib.idle_add(lambda: self.handle_redis_message(message))
-                except Exception as e:
-                    print(f"Error in Redis listener: {e}")
-                    break
-
-        redis_thread = threading.Thread(target=redis_listener, daemon=True)
-        redis_thread.start()
-
         # Add timeout just for audio processing
         self.first_timeout_call = True
         GLib.timeout_add(100, self.on_main_loop_timeout)
+
+        # Write detected utterances to the database in batches
+        GLib.timeout_add(250, self.on_flush_utterances_timeout)
         
         # Add signal handlers so that when we get a SIGTERM or SIGINT, we can clean up the bot
         GLib.unix_signal_add(GLib.PRIORITY_HIGH, signal.SIGTERM, self.handle_glib_shutdown)
@@ -158,8 +303,7 @@ class BotController:
             self.cleanup()
         finally:
             # Clean up Redis subscription
-            pubsub.unsubscribe(channel)
-            pubsub.close()
+            unsubscribe_from_redis_channel(channel)
 
     def take_action_based_on_bot_in_db(self):
         if self.bot_in_db.state == BotStates.JOINING:
@@ -184,22 +328,23 @@ class BotController:
         oldest_enqueued_media_request = self.bot_in_db.media_requests.filter(state=BotMediaRequestStates.ENQUEUED, media_type=media_type).order_by('created_at').first()
         if not oldest_enqueued_media_request:
             return
-        currently_playing_media_request = self.bot_in_db.media_requests.filter(state=BotMediaRequestStates.PLAYING, media_type=media_type).first()
-        if currently_playing_media_request:
-            print(f"Currently playing media request {currently_playing_media_request.id} so cannot play another media request")
+        currently_playing_media_request_id = self.bot_in_db.media_requests.filter(state=BotMediaRequestStates.PLAYING, media_type=media_type).values_list('id', flat=True).first()
+        if currently_playing_media_request_id:
+            print(f"Currently playing media request {currently_playing_media_request_id} so cannot play another media request")
             return
         
-        from bots.utils import mp3_to_pcm
         try:
             BotMediaRequestManager.set_media_request_playing(oldest_enqueued_media_request)
-            self.adapter.send_raw_audio(mp3_to_pcm(oldest_enqueued_media_request.media_blob.blob, sample_rate=8000))
+            self.adapter.send_raw_audio(_get_pcm_for_media_blob(oldest_enqueued_media_request.media_blob_id))
             self.audio_output_manager.start_playing_audio_media_request(oldest_enqueued_media_request)
         except Exception as e:
             print(f"Error sending raw audio: {e}")
             BotMediaRequestManager.set_media_request_failed_to_play(oldest_enqueued_media_request)
 
     def take_action_based_on_image_media_requests_in_db(self):
-        from bots.utils import png_to_yuv420_frame
+        import gi
+        gi.require_version('GLib', '2.0')
+        from gi.repository import GLib
 
         media_type = BotMediaRequestMediaTypes.IMAGE
         
@@ -209,25 +354,55 @@ class BotController:
             media_type=media_type
         ).order_by('created_at')
 
-        if not enqueued_requests.exists():
-            return
-
         # Get the most recently created request
         most_recent_request = enqueued_requests.last()
+        if not most_recent_request:
+            return
         
-        # Mark the most recent request as FINISHED
+        # Decode the image off the main loop, then send it back on the main loop
         try:
             BotMediaRequestManager.set_media_request_playing(most_recent_request)
-            self.adapter.send_raw_image(png_to_yuv420_frame(most_recent_request.media_blob.blob))
-            BotMediaRequestManager.set_media_request_finished(most_recent_request)
+            media_blob_id = most_recent_request.media_blob_id
+            decoded_frame = self.decoded_image_frames_by_media_blob_id.get(media_blob_id)
+            if decoded_frame is not None:
+                self.send_image_media_request_frame(most_recent_request, decoded_frame)
+            else:
+                from bots.utils import png_to_yuv420_frame
+                blob = MediaBlob.objects.only('blob').get(id=media_blob_id).blob
+                decode_future = _image_decode_executor.submit(png_to_yuv420_frame, blob)
+                decode_future.add_done_callback(lambda future: GLib.idle_add(self.on_image_media_request_decoded, most_recent_request, media_blob_id, future))
         except Exception as e:
             print(f"Error sending raw image: {e}")
             BotMediaRequestManager.set_media_request_failed_to_play(most_recent_request)
         
-        # Mark all other enqueued requests as DROPPED
+        # Mark all other enqueued requests as DROPPED, through the manager like every other state transition
         for request in enqueued_requests.exclude(id=most_recent_request.id):
             BotMediaRequestManager.set_media_request_dropped(request)
 
+    def on_image_media_request_decoded(self, media_request, media_blob_id, decode_future):
+        try:
+            decoded_frame = decode_future.result()
+        except Exception as e:
+            print(f"Error decoding image: {e}")
+            BotMediaRequestManager.set_media_request_failed_to_play(media_request)
+            return False
+
+        self.decoded_image_frames_by_media_blob_id[media_blob_id] = decoded_frame
+        if len(self.decoded_image_frames_by_media_blob_id) > self.MAX_DECODED_IMAGE_FRAMES:
+            del self.decoded_image_frames_by_media_blob_id[next(iter(self.decoded_image_frames_by_media_blob_id))]
+
+        self.send_image_media_request_frame(media_request, decoded_frame)
+        return False
+
+    def send_image_media_request_frame(self, media_request, decoded_frame):
+        # Mark the request as FINISHED once the decoded frame has been sent
+        try:
+            self.adapter.send_raw_image(decoded_frame)
+            BotMediaRequestManager.set_media_request_finished(media_request)
+        except Exception as e:
+            print(f"Error sending raw image: {e}")
+            BotMediaRequestManager.set_media_request_failed_to_play(media_request)
+
     def take_action_based_on_media_requests_in_db(self):
         self.take_action_based_on_audio_media_requests_in_db()
         self.take_action_based_on_image_media_requests_in_db()
@@ -249,12 +424,13 @@ class BotController:
 
     def handle_redis_message(self, message):
         if message and message['type'] == 'message':
-            data = json.loads(message['data'].decode('utf-8'))
+            data = orjson.loads(message['data'])
             command = data.get('command')
             
             if command == 'sync':
                 print(f"Syncing bot {self.bot_in_db.object_id}")
                 self.bot_in_db.refresh_from_db()
+                self.recording_in_progress = None
                 self.take_action_based_on_bot_in_db()
             elif command == 'sync_media_requests':
                 print(f"Syncing media requests for bot {self.bot_in_db.object_id}")
@@ -283,40 +459,83 @@ class BotController:
             self.cleanup()
             return False
 
-    def save_utterance(self, message):
-        from bots.tasks.process_utterance_task import process_utterance
+    def get_recording_in_progress(self):
+        if self.recording_in_progress is not None:
+            return self.recording_in_progress
 
+        # Fetch up to two rows so both error cases are caught with one query
+        recordings_in_progress = list(Recording.objects.filter(bot=self.bot_in_db, state=RecordingStates.IN_PROGRESS)[:2])
+        if len(recordings_in_progress) == 0:
+            raise Exception("No recording in progress found")
+        if len(recordings_in_progress) > 1:
+            raise Exception(f"Expected at most one recording in progress for bot {self.bot_in_db.object_id}, but found more than one")
+        self.recording_in_progress = recordings_in_progress[0]
+        return self.recording_in_progress
+
+    def save_utterance(self, message):
         print(f"Received message that new utterance was detected")
 
-        # Create participant record if it doesn't exist
-        participant, _ = Participant.objects.get_or_create(
-            bot=self.bot_in_db,
-            uuid=message['participant_uuid'],
-            defaults={
-                'user_uuid': message['participant_user_uuid'],
-                'full_name': message['participant_full_name'],
-            }
-        )
+        # Written to the database by flush_pending_utterances
+        self.pending_utterance_messages.append(message)
 
-        # Create new utterance record
-        recordings_in_progress = Recording.objects.filter(bot=self.bot_in_db, state=RecordingStates.IN_PROGRESS)
-        if recordings_in_progress.count() == 0:
-            raise Exception("No recording in progress found")
-        if recordings_in_progress.count() > 1:
-            raise Exception(f"Expected at most one recording in progress for bot {self.bot_in_db.object_id}, but found {recordings_in_progress.count()}")
-        recording_in_progress = recordings_in_progress.first()
-        utterance = Utterance.objects.create(
-            recording=recording_in_progress,
-            participant=participant,
-            audio_blob=message['audio_data'],
-            audio_format=Utterance.AudioFormat.PCM,
-            timestamp_ms=message['timestamp_ms'],
-            duration_ms=len(message['audio_data']) / 64,
-        )
+    def on_flush_utterances_timeout(self):
+        try:
+            self.flush_pending_utterances()
+        except Exception as e:
+            print(f"Error saving {len(self.pending_utterance_messages)} pending utterances, will retry: {e}")
+        return not self.cleanup_called
 
-        # Process the utterance immediately
-        process_utterance.delay(utterance.id)
-        return
+    def flush_pending_utterances(self):
+        from bots.tasks.process_utterance_task import process_utterance
+        from django.db import transaction
+
+        if not self.pending_utterance_messages:
+            return
+        # Messages stay pending until they're saved, so a failed flush is retried on the next one
+        messages = list(self.pending_utterance_messages)
+
+        # First message for each participant this bot hasn't looked up yet, keyed by uuid
+        new_participant_messages = {}
+        for message in messages:
+            if message['participant_uuid'] not in self.participant_ids_by_uuid:
+                new_participant_messages.setdefault(message['participant_uuid'], message)
+
+        recording_in_progress = self.get_recording_in_progress()
+        with transaction.atomic():
+            participant_ids_by_uuid = dict(self.participant_ids_by_uuid)
+            # get_or_create rather than bulk_create(ignore_conflicts=True): Participant has no unique constraint
+            # on (bot, uuid) to make the bulk insert skip existing rows. This runs once per participant per bot.
+            for participant_uuid, message in new_participant_messages.items():
+                participant, _ = Participant.objects.get_or_create(
+                    bot=self.bot_in_db,
+                    uuid=participant_uuid,
+                    defaults={
+                        'user_uuid': message['participant_user_uuid'],
+                        'full_name': message['participant_full_name'],
+                    }
+                )
+                participant_ids_by_uuid[participant_uuid] = participant.id
+
+            # Create new utterance records
+            utterances = Utterance.objects.bulk_create([
+                Utterance(
+                    recording=recording_in_progress,
+                    participant_id=participant_ids_by_uuid[message['participant_uuid']],
+                    audio_blob=message['audio_data'],
+                    audio_format=Utterance.AudioFormat.PCM,
+                    timestamp_ms=message['timestamp_ms'],
+                    duration_ms=len(message['audio_data']) / 64,
+                )
+                for message in messages
+            ])
+
+        # Saved, so only now cache the participant ids and drop the messages
+        self.participant_ids_by_uuid = participant_ids_by_uuid
+        del self.pending_utterance_messages[:len(messages)]
+
+        # Process the utterances immediately
+        for utterance in utterances:
+            process_utterance.delay(utterance.id)
     
     def on_message_from_adapter(self, message):
         import gi
@@ -328,11 +547,15 @@ class BotController:
     def take_action_based_on_message_from_adapter(self, message):
         from bot.bot_adapter import ZoomBotAdapter
 
+        # Adapter messages create bot events, which can move the recording between states
+        self.recording_in_progress = None
+
         if message.get('message') == ZoomBotAdapter.Messages.MEETING_ENDED:
             print("Received message that meeting ended")
             if self.individual_audio_input_manager:
                 print("Flushing utterances...")
                 self.individual_audio_input_manager.flush_utterances()
+                self.flush_pending_utterances()
 
             if self.bot_in_db.state == BotStates.LEAVING:
                 BotEventManager.create_event(
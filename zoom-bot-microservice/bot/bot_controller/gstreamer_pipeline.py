@@ -2,6 +2,7 @@ import gi
 gi.require_version('Gst', '1.0')
 from gi.repository import Gst, GLib
 import time
+import numpy as np
 
 class GstreamerPipeline:
     def __init__(self, on_new_sample_callback, video_frame_size):
@@ -12,15 +13,23 @@ class GstreamerPipeline:
         self.recording_active = False
 
         self.audio_appsrc = None
+        self.audio_caps = None
         self.audio_recording_active = False
 
         self.start_time_ns = None  # Will be set on first frame/audio sample
 
+        # Recycled Gst buffers for pushed frames/audio, created in setup / on the first audio chunk
+        self.video_buffer_pool = None
+        self.video_buffer_size = None
+        self.audio_buffer_pool = None
+        self.audio_buffer_size = None
+
         # Initialize GStreamer
         Gst.init(None)
 
-        self.queue_drops = {f'q{i}': 0 for i in range(1, 8)}
-        self.last_reported_drops = {f'q{i}': 0 for i in range(1, 8)}
+        # Drop counts for queues q1..q7, indexed 0..6
+        self.queue_drops = np.zeros(7, dtype=np.uint64)
+        self.last_reported_drops = np.zeros(7, dtype=np.uint64)
 
     def on_new_sample_from_appsink(self, sink):
         """Handle new samples from the appsink"""
@@ -32,6 +41,36 @@ class GstreamerPipeline:
             return Gst.FlowReturn.OK
         return Gst.FlowReturn.ERROR
     
+    def video_encoder_pipeline_str(self):
+        """Pick a hardware H.264 encoder if one is registered, otherwise fall back to x264"""
+        # Both hardware encoders accept I420 from system memory, so the caps on video_source stay the same
+        if Gst.ElementFactory.find('nvh264enc'):
+            encoder_str = 'nvh264enc preset=low-latency-hp rc-mode=cbr bitrate=4000 ! h264parse ! '
+        elif Gst.ElementFactory.find('vaapih264enc'):
+            encoder_str = 'vaapih264enc rate-control=cbr bitrate=4000 ! h264parse ! '
+        else:
+            encoder_str = 'x264enc tune=zerolatency speed-preset=ultrafast threads=4 sliced-threads=true key-int-max=60 bframes=0 rc-lookahead=0 ! '
+        print(f"Using video encoder: {encoder_str.split()[0]}")
+        return encoder_str
+
+    def create_buffer_pool(self, caps, size):
+        pool = Gst.BufferPool.new()
+        config = pool.get_config()
+        # max_buffers=0 lets the pool grow instead of blocking the caller when every buffer is in flight
+        Gst.BufferPool.config_set_params(config, caps, size, 4, 0)
+        pool.set_config(config)
+        pool.set_active(True)
+        return pool
+
+    def new_buffer(self, pool, pool_buffer_size, data):
+        """Copy data into a recycled buffer from pool, or a freshly wrapped one if its size doesn't match"""
+        if pool is not None and len(data) == pool_buffer_size:
+            ret, buffer = pool.acquire_buffer(None)
+            if ret == Gst.FlowReturn.OK:
+                buffer.fill(0, data)
+                return buffer
+        return Gst.Buffer.new_wrapped(data)
+
     def setup(self):
         """Initialize GStreamer pipeline for combined MP4 recording with audio and video"""
         self.start_time_ns = None
@@ -41,8 +80,8 @@ class GstreamerPipeline:
             'queue name=q1 max-size-buffers=1000 max-size-bytes=100000000 max-size-time=0 ! ' # q1 can contain 100mb of video before it drops
             'videoconvert ! '
             'videorate ! '
-            'queue name=q2 max-size-buffers=1000 max-size-bytes=200000000 max-size-time=0 ! ' # q2 can contain 100mb of video before it drops
-            'x264enc tune=zerolatency speed-preset=ultrafast ! '
+            'queue name=q2 max-size-buffers=8 max-size-bytes=0 max-size-time=0 leaky=no ! ' # small hand-off queue so the encoder runs on its own threads
+            f'{self.video_encoder_pipeline_str()}'
             'queue name=q3 max-size-buffers=1000 max-size-bytes=100000000 max-size-time=0 ! '
             'mp4mux name=muxer ! queue name=q4 ! appsink name=sink emit-signals=true sync=false drop=false '
             'appsrc name=audio_source do-timestamp=false stream-type=0 format=time ! '
@@ -64,17 +103,27 @@ class GstreamerPipeline:
         # Configure video appsrc
         video_caps = Gst.Caps.from_string(f'video/x-raw,format=I420,width={self.video_frame_size[0]},height={self.video_frame_size[1]},framerate=30/1')
         self.appsrc.set_property('caps', video_caps)
+        self.video_buffer_size = self.video_frame_size[0] * self.video_frame_size[1] * 3 // 2
+        self.video_buffer_pool = self.create_buffer_pool(video_caps, self.video_buffer_size)
         self.appsrc.set_property('format', Gst.Format.TIME)
         self.appsrc.set_property('is-live', True)
+        # Buffers are stamped with their capture time, not the time they reach appsrc. Video frames go through
+        # the scale worker first, so the push time would drift from the audio by however long that takes.
         self.appsrc.set_property('do-timestamp', False)
         self.appsrc.set_property('stream-type', 0)  # GST_APP_STREAM_TYPE_STREAM
-        self.appsrc.set_property('block', True)  # This helps with synchronization
+        # Never block the GLib main loop on a slow encoder. Keep about a second of frames
+        # queued in appsrc and drop the oldest beyond that.
+        self.appsrc.set_property('block', False)
+        self.appsrc.set_property('max-bytes', self.video_frame_size[0] * self.video_frame_size[1] * 3 // 2 * 30)
+        if self.appsrc.find_property('leaky-type'):  # GStreamer >= 1.20
+            self.appsrc.set_property('leaky-type', 2)  # GST_APP_LEAKY_TYPE_DOWNSTREAM
 
         # Configure audio appsrc
         audio_caps = Gst.Caps.from_string(
             'audio/x-raw,format=S16LE,channels=1,rate=32000,layout=interleaved'
         )
         self.audio_appsrc.set_property('caps', audio_caps)
+        self.audio_caps = audio_caps
         self.audio_appsrc.set_property('format', Gst.Format.TIME)
         self.audio_appsrc.set_property('is-live', True)
         self.audio_appsrc.set_property('do-timestamp', False)
@@ -104,7 +153,7 @@ class GstreamerPipeline:
         for i in range(1, 8):
             queue = self.pipeline.get_by_name(f'q{i}')
             if queue:
-                queue.connect('overrun', self.on_queue_overrun, f'q{i}')
+                queue.connect('overrun', self.on_queue_overrun, i - 1)
 
     def on_pipeline_message(self, bus, message):
         """Handle pipeline messages"""
@@ -123,20 +172,19 @@ class GstreamerPipeline:
         try:
             # Print dropped buffer counts since last check
             print("\nDropped Buffers Since Last Check:")
-            for queue_name in self.queue_drops:
-                drops = self.queue_drops[queue_name] - self.last_reported_drops[queue_name]
-                if drops > 0:
-                    print(f"  {queue_name}: {drops} buffers dropped")
-                self.last_reported_drops[queue_name] = self.queue_drops[queue_name]
+            drops = self.queue_drops - self.last_reported_drops
+            for queue_index in np.flatnonzero(drops):
+                print(f"  q{queue_index + 1}: {drops[queue_index]} buffers dropped")
+            self.last_reported_drops[:] = self.queue_drops
 
         except Exception as e:
             print(f"Error getting pipeline stats: {e}")
         
         return True  # Continue timer
 
-    def on_queue_overrun(self, queue, queue_name):
+    def on_queue_overrun(self, queue, queue_index):
         """Callback for when a queue drops buffers"""
-        self.queue_drops[queue_name] += 1
+        self.queue_drops[queue_index] += 1
         return True
     
     def on_mixed_audio_raw_data_received_callback(self, data):
@@ -146,14 +194,19 @@ class GstreamerPipeline:
         try:
             current_time_ns = time.time_ns()
             buffer_bytes = data.GetBuffer()
-            buffer = Gst.Buffer.new_wrapped(buffer_bytes)
+
+            # The SDK delivers fixed-size chunks, so size the pool from the first one
+            if self.audio_buffer_pool is None:
+                self.audio_buffer_size = len(buffer_bytes)
+                self.audio_buffer_pool = self.create_buffer_pool(self.audio_caps, self.audio_buffer_size)
+            buffer = self.new_buffer(self.audio_buffer_pool, self.audio_buffer_size, buffer_bytes)
             
             # Initialize start time if not set
             if self.start_time_ns is None:
                 self.start_time_ns = current_time_ns
             
             # Calculate timestamp relative to same start time as video
-            buffer.pts = current_time_ns - self.start_time_ns
+            buffer.pts = max(current_time_ns - self.start_time_ns, 0)
             
             ret = self.audio_appsrc.emit('push-buffer', buffer)
             if ret != Gst.FlowReturn.OK:
@@ -173,11 +226,12 @@ class GstreamerPipeline:
             if self.start_time_ns is None:
                 self.start_time_ns = current_time_ns
 
-            # Calculate buffer timestamp relative to start time
-            buffer_pts = current_time_ns - self.start_time_ns
+            # Calculate buffer timestamp relative to start time. A frame captured just before the first audio
+            # chunk can still be arriving from the scale worker, so clamp instead of going negative.
+            buffer_pts = max(current_time_ns - self.start_time_ns, 0)
             
             # Create buffer with timestamp
-            buffer = Gst.Buffer.new_wrapped(frame)
+            buffer = self.new_buffer(self.video_buffer_pool, self.video_buffer_size, frame)
             buffer.pts = buffer_pts
             
             # Calculate duration based on time until next frame
@@ -218,4 +272,9 @@ class GstreamerPipeline:
             print(f"Error during pipeline shutdown: {err}, {debug}")
         
         self.pipeline.set_state(Gst.State.NULL)
+
+        for pool in (self.video_buffer_pool, self.audio_buffer_pool):
+            if pool is not None:
+                pool.set_active(False)
+
         print("GStreamer pipeline shut down")
\ No newline at end of file
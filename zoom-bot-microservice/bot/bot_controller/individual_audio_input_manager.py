@@ -1,97 +1,165 @@
-import queue
+from collections import deque
+import time
 import webrtcvad
-from datetime import datetime, timedelta
 import numpy as np
 
-def calculate_normalized_rms(audio_bytes):
-    samples = np.frombuffer(audio_bytes, dtype=np.int16)
-    rms = np.sqrt(np.mean(np.square(samples)))
-    # Normalize by max possible value for 16-bit audio (32768)
-    return rms / 32768
+# Below this RMS, normalized by the max possible value for 16-bit audio (32768), a chunk is silent
+SILENCE_RMS_THRESHOLD = 0.01
+# The same threshold as a mean of squared raw samples, so the check needs no sqrt or normalization
+SILENCE_MEAN_SQUARE_THRESHOLD = (SILENCE_RMS_THRESHOLD * 32768) ** 2
+
+def calculate_mean_square(samples):
+    samples = samples.astype(np.int64)
+    # Exact sum of squares as a single dot product; squaring the int16 samples directly would wrap around
+    return int(np.dot(samples, samples)) / len(samples)
+
+# Returns the int16 samples and mean square of each chunk
+def samples_and_mean_squares_for_chunks(chunks):
+    # The SDK delivers fixed size chunks, so they can usually be stacked into one 2D array and reduced in a single pass
+    chunk_lengths = set(map(len, chunks))
+    if len(chunk_lengths) == 1 and 0 not in chunk_lengths:
+        samples = np.frombuffer(b''.join(chunks), dtype=np.int16).reshape(len(chunks), -1)
+        wide_samples = samples.astype(np.int64)
+        return samples, np.einsum('ij,ij->i', wide_samples, wide_samples) / samples.shape[1]
+    samples = [np.frombuffer(chunk, dtype=np.int16) for chunk in chunks]
+    return samples, [calculate_mean_square(chunk_samples) if len(chunk_samples) else 0.0 for chunk_samples in samples]
+
+class SpeakerState:
+    """The utterance currently being recorded for one speaker."""
+
+    __slots__ = ('buffer', 'size', 'sample_limit', 'first_nonsilent_audio_time', 'last_nonsilent_audio_time')
+
+    def __init__(self, chunk_time, initial_capacity, sample_limit):
+        # int16 samples; size is how many of them have been written. The buffer starts small and doubles
+        # as needed, up to sample_limit.
+        self.buffer = np.empty(min(initial_capacity, sample_limit), dtype=np.int16)
+        self.size = 0
+        self.sample_limit = sample_limit
+        self.first_nonsilent_audio_time = chunk_time
+        self.last_nonsilent_audio_time = chunk_time
+
+    def append(self, samples):
+        end = self.size + len(samples)
+        if end > len(self.buffer):
+            # Past sample_limit only the chunk that crosses it gets here, and the utterance is flushed right after it
+            new_buffer = np.empty(max(end, min(2 * len(self.buffer), self.sample_limit)), dtype=np.int16)
+            new_buffer[:self.size] = self.buffer[:self.size]
+            self.buffer = new_buffer
+        self.buffer[self.size:end] = samples
+        self.size = end
 
 class IndividualAudioInputManager:
+    # Upper bound on chunks waiting to be processed. The SDK callback only enqueues chunks and the main loop
+    # drains them, so this only fills up if the main loop stalls. About 20 seconds of audio for 10 speakers
+    # at 10ms per chunk.
+    MAX_QUEUED_CHUNKS = 20000
+
     def __init__(self, *, save_utterance_callback, get_participant_callback):
-        self.queue = queue.Queue()
+        # One producer (the SDK audio callback) and one consumer (the main loop). deque's append and popleft
+        # are atomic, so this doesn't need queue.Queue's lock and condition variable.
+        self.queue = deque()
+        self.dropped_chunk_count = 0
 
         self.save_utterance_callback = save_utterance_callback
         self.get_participant_callback = get_participant_callback
 
-        self.utterances = {}
+        # In-progress utterance per speaker, keyed by speaker id
+        self.speakers = {}
         self.sample_rate = 32000
 
-        self.first_nonsilent_audio_time = {}
-        self.last_nonsilent_audio_time = {}
-
         self.UTTERANCE_SIZE_LIMIT = 19200000  # 19.2 MB / 2 bytes per sample / 32,000 samples per second = 300 seconds of continuous audio
+        self.UTTERANCE_SAMPLE_LIMIT = self.UTTERANCE_SIZE_LIMIT // 2
+        self.UTTERANCE_INITIAL_CAPACITY = self.sample_rate * 2  # samples, 2 seconds of audio
         self.SILENCE_DURATION_LIMIT = 3  # seconds
-        self.vad = webrtcvad.Vad()
+        # Least aggressive mode; the RMS gate in silence_detected already drops quiet chunks
+        self.vad = webrtcvad.Vad(0)
+        # webrtcvad only accepts 10, 20 or 30ms frames. Chunks of any other length are checked 20ms at a time.
+        self.vad_frame_lengths = frozenset(int(frame_ms * self.sample_rate / 1000) * 2 for frame_ms in (10, 20, 30))
+        self.vad_frame_bytes = int(0.02 * self.sample_rate) * 2
 
+    # chunk_time is wall clock time in nanoseconds (time.time_ns())
     def add_chunk(self, speaker_id, chunk_time, chunk_bytes):
-        self.queue.put((speaker_id, chunk_time, chunk_bytes))
+        # This is called from the SDK's audio callback, so never block it. Drop the chunk if we're too far behind.
+        if len(self.queue) >= self.MAX_QUEUED_CHUNKS:
+            self.dropped_chunk_count += 1
+            if self.dropped_chunk_count % 1000 == 1:
+                print(f"Audio chunk queue is full, dropped {self.dropped_chunk_count} chunks so far")
+            return
+        self.queue.append((speaker_id, chunk_time, chunk_bytes))
 
     def process_chunks(self):
-        while not self.queue.empty():
-            speaker_id, chunk_time, chunk_bytes = self.queue.get()
-            self.process_chunk(speaker_id, chunk_time, chunk_bytes)
+        queued_chunks = []
+        while self.queue:
+            queued_chunks.append(self.queue.popleft())
+
+        # Compute the RMS of everything that was queued at once; the VAD only runs on chunks that pass the RMS gate
+        if queued_chunks:
+            # The bytes are still needed for the VAD, but the utterance buffers are filled from the decoded samples
+            samples, mean_squares = samples_and_mean_squares_for_chunks([chunk_bytes for _, _, chunk_bytes in queued_chunks])
+            for (speaker_id, chunk_time, chunk_bytes), chunk_samples, mean_square in zip(queued_chunks, samples, mean_squares):
+                audio_is_silent = self.silence_detected(chunk_bytes, mean_square) if chunk_bytes else True
+                self.process_chunk(speaker_id, chunk_time, chunk_samples, audio_is_silent)
 
-        for speaker_id in list(self.first_nonsilent_audio_time.keys()):
-            self.process_chunk(speaker_id, datetime.utcnow(), None)
+        for speaker_id in list(self.speakers.keys()):
+            self.process_chunk(speaker_id, time.time_ns(), None, True)
 
     # When the meeting ends, we need to flush all utterances. Do this by pretending that we received a chunk of silence at the end of the meeting.
     def flush_utterances(self):
-        for speaker_id in list(self.first_nonsilent_audio_time.keys()):
-            self.process_chunk(speaker_id, datetime.utcnow() + timedelta(seconds=self.SILENCE_DURATION_LIMIT + 1), None)
+        for speaker_id in list(self.speakers.keys()):
+            self.process_chunk(speaker_id, time.time_ns() + (self.SILENCE_DURATION_LIMIT + 1) * 1_000_000_000, None, True)
 
-    def silence_detected(self, chunk_bytes):
-        if calculate_normalized_rms(chunk_bytes) < 0.01:
+    def silence_detected(self, chunk_bytes, mean_square):
+        if mean_square < SILENCE_MEAN_SQUARE_THRESHOLD:
             return True
-        return not self.vad.is_speech(chunk_bytes, self.sample_rate)
-
-    def process_chunk(self, speaker_id, chunk_time, chunk_bytes):
-        audio_is_silent = self.silence_detected(chunk_bytes) if chunk_bytes else True
-        
+        if len(chunk_bytes) in self.vad_frame_lengths:
+            return not self.vad.is_speech(chunk_bytes, self.sample_rate)
+        # A chunk shorter than 20ms can't be checked by the VAD, so it's judged by the RMS gate alone
+        for offset in range(0, len(chunk_bytes) - self.vad_frame_bytes + 1, self.vad_frame_bytes):
+            if not self.vad.is_speech(chunk_bytes[offset:offset + self.vad_frame_bytes], self.sample_rate):
+                return True
+        return False
+
+    # samples is the chunk as an int16 array, or None when there is no new audio
+    def process_chunk(self, speaker_id, chunk_time, samples, audio_is_silent):
         # Initialize buffer and timing for new speaker
-        if speaker_id not in self.utterances or len(self.utterances[speaker_id]) == 0:
+        speaker = self.speakers.get(speaker_id)
+        if speaker is None:
             if audio_is_silent:
                 return
-            self.utterances[speaker_id] = bytearray()
-            self.first_nonsilent_audio_time[speaker_id] = chunk_time
-            self.last_nonsilent_audio_time[speaker_id] = chunk_time
+            speaker = self.speakers[speaker_id] = SpeakerState(chunk_time, self.UTTERANCE_INITIAL_CAPACITY, self.UTTERANCE_SAMPLE_LIMIT)
 
         # Add new audio data to buffer
-        if chunk_bytes:
-            self.utterances[speaker_id].extend(chunk_bytes)
+        if samples is not None and len(samples) > 0:
+            speaker.append(samples)
         
         should_flush = False
         reason = None
 
         # Check buffer size
-        if len(self.utterances[speaker_id]) >= self.UTTERANCE_SIZE_LIMIT:
+        if speaker.size >= self.UTTERANCE_SAMPLE_LIMIT:
             should_flush = True
             reason = "buffer_full"
         
         # Check for silence
         if audio_is_silent:
-            silence_duration = (chunk_time - self.last_nonsilent_audio_time[speaker_id]).total_seconds()
+            silence_duration = (chunk_time - speaker.last_nonsilent_audio_time) / 1_000_000_000
             if silence_duration >= self.SILENCE_DURATION_LIMIT:
                 should_flush = True
                 reason = "silence_limit"
         else:
-            self.last_nonsilent_audio_time[speaker_id] = chunk_time
+            speaker.last_nonsilent_audio_time = chunk_time
 
             print(f"Speaker {speaker_id} is speaking")
 
         # Flush buffer if needed
-        if should_flush and len(self.utterances[speaker_id]) > 0:
+        if should_flush and speaker.size > 0:
             participant = self.get_participant_callback(speaker_id)
             if participant:
                 self.save_utterance_callback({
                     **participant,
-                    'audio_data': bytes(self.utterances[speaker_id]),
-                    'timestamp_ms': int(self.first_nonsilent_audio_time[speaker_id].timestamp() * 1000),
+                    'audio_data': speaker.buffer[:speaker.size].tobytes(),
+                    'timestamp_ms': speaker.first_nonsilent_audio_time // 1_000_000,
                     'flush_reason': reason
                 })
-            # Clear the buffer
-            self.utterances[speaker_id] = bytearray()
-            del self.first_nonsilent_audio_time[speaker_id]
-            del self.last_nonsilent_audio_time[speaker_id]
\ No newline at end of file
+            # Release the buffer
+            del self.speakers[speaker_id]
\ No newline at end of file
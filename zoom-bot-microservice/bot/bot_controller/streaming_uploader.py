@@ -1,97 +1,102 @@
 import boto3
-import threading
-from io import BytesIO
-from queue import Queue
+from botocore.config import Config
+from concurrent.futures import ThreadPoolExecutor, wait
 import logging
 
 class StreamingUploader:
-    def __init__(self, bucket, key, chunk_size=5242880):  # 5MB chunks
-        self.s3_client = boto3.client('s3')
+    def __init__(self, bucket, key, chunk_size=16777216, max_concurrent_uploads=8):  # 16MB chunks
+        # One pooled connection per upload worker, and retry throttled or failed part uploads
+        self.s3_client = boto3.client('s3', config=Config(
+            max_pool_connections=max_concurrent_uploads,
+            retries={'max_attempts': 5, 'mode': 'standard'}
+        ))
         self.bucket = bucket
         self.key = key
         self.chunk_size = chunk_size
-        self.buffer = BytesIO()
+        # Current part, filled in place; handed to the uploader whole and replaced when full
+        self.part_buffer = bytearray(chunk_size)
+        self.part_offset = 0
         self.upload_id = None
         self.parts = []
         self.part_number = 1
         
-        # Add upload queue and worker thread
-        self.upload_queue = Queue()
-        self.upload_thread = threading.Thread(target=self._upload_worker, daemon=True)
-        self.upload_thread.start()
-        
-    def _upload_worker(self):
-        """Background thread to handle uploads"""
-        while True:
-            try:
-                chunk, part_num = self.upload_queue.get()
-                if chunk is None:  # Sentinel value to stop the thread
-                    break
-                    
-                response = self.s3_client.upload_part(
-                    Bucket=self.bucket,
-                    Key=self.key,
-                    PartNumber=part_num,
-                    UploadId=self.upload_id,
-                    Body=chunk
-                )
-                
-                self.parts.append({
-                    'PartNumber': part_num,
-                    'ETag': response['ETag']
-                })
-            except Exception as e:
-                logging.error(f"Upload error: {e}")
-            finally:
-                self.upload_queue.task_done()
+        # Parts upload concurrently; a new part starts as soon as any worker is free
+        self.upload_executor = ThreadPoolExecutor(max_workers=max_concurrent_uploads)
+        self.upload_futures = []
+
+    def _upload_chunk(self, chunk, part_num):
+        """Uploads one part on an executor thread"""
+        response = self.s3_client.upload_part(
+            Bucket=self.bucket,
+            Key=self.key,
+            PartNumber=part_num,
+            UploadId=self.upload_id,
+            Body=chunk
+        )
+        return {
+            'PartNumber': part_num,
+            'ETag': response['ETag']
+        }
     
     def upload_part(self, data):
-        self.buffer.write(data)
-        
-        # Upload complete chunks
-        while self.buffer.tell() >= self.chunk_size:
-            self.buffer.seek(0)
-            chunk = self.buffer.read(self.chunk_size)
-            
-            # Queue the chunk for upload instead of uploading directly
-            self.upload_queue.put((chunk, self.part_number))
-            self.part_number += 1
-            
-            # Keep remaining data
-            remaining = self.buffer.read()
-            self.buffer = BytesIO()
-            self.buffer.write(remaining)
+        data = memoryview(data)
+
+        while len(data) > 0:
+            # Copy as much as fits into the current part
+            n = min(len(data), self.chunk_size - self.part_offset)
+            self.part_buffer[self.part_offset:self.part_offset + n] = data[:n]
+            self.part_offset += n
+            data = data[n:]
+
+            # Upload complete chunks
+            if self.part_offset == self.chunk_size:
+                # Hand the chunk to the executor instead of uploading directly
+                self.upload_futures.append(self.upload_executor.submit(self._upload_chunk, self.part_buffer, self.part_number))
+                self.part_number += 1
+
+                self.part_buffer = bytearray(self.chunk_size)
+                self.part_offset = 0
     
     def complete_upload(self):
-        # If we never started a multipart upload (len(self.parts) == 0), do a regular upload
-        if len(self.parts) == 0:
-            self.buffer.seek(0)
-            data = self.buffer.getvalue()
+        # If we never queued a part, do a regular upload
+        if len(self.upload_futures) == 0:
+            data = bytes(self.part_buffer[:self.part_offset])
             self.s3_client.put_object(
                 Bucket=self.bucket,
                 Key=self.key,
                 Body=data
             )
-            print("len(self.parts) == 0, so did a regular upload")
+            print("len(self.upload_futures) == 0, so did a regular upload")
+            self.upload_executor.shutdown()
             return
 
         # Upload final part if any data remains
-        if self.buffer.tell() > 0:
-            self.buffer.seek(0)
-            final_chunk = self.buffer.getvalue()
-            self.upload_queue.put((final_chunk, self.part_number))
+        if self.part_offset > 0:
+            final_chunk = bytes(self.part_buffer[:self.part_offset])
+            self.upload_futures.append(self.upload_executor.submit(self._upload_chunk, final_chunk, self.part_number))
         
-        # Wait for all uploads to complete
-        self.upload_queue.join()
-        self.upload_queue.put((None, None))  # Stop the worker thread
-        self.upload_thread.join()
+        # Wait for all uploads to complete, then collect them in part order
+        wait(self.upload_futures)
+        self.upload_executor.shutdown()
+        for future in self.upload_futures:
+            try:
+                self.parts.append(future.result())
+            except Exception as e:
+                # A missing part would leave a gap in the file, so abort instead of completing the upload
+                logging.error(f"Upload error: {e}")
+                self.s3_client.abort_multipart_upload(
+                    Bucket=self.bucket,
+                    Key=self.key,
+                    UploadId=self.upload_id
+                )
+                raise
         
         # Complete multipart upload
         self.s3_client.complete_multipart_upload(
             Bucket=self.bucket,
             Key=self.key,
             UploadId=self.upload_id,
-            MultipartUpload={'Parts': sorted(self.parts, key=lambda x: x['PartNumber'])}
+            MultipartUpload={'Parts': self.parts}
         )
     
     def start_upload(self):